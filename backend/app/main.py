@@ -3,13 +3,20 @@ Congestion Game Simulator - FastAPI Backend
 Implements Wardrop Equilibrium and System Optimum solvers using Frank-Wolfe algorithm
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List, Dict, Optional, Tuple
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import groupby
+import hashlib
+import json
+import threading
 import numpy as np
-from scipy.optimize import minimize_scalar
-import networkx as nx
+from scipy import sparse
+from scipy.sparse.csgraph import dijkstra
+from numba import njit
 
 app = FastAPI(title="Congestion Game Simulator", version="1.0.0")
 
@@ -83,340 +90,649 @@ class ComputationResult(BaseModel):
     price_of_anarchy: float
     optimal_tolls: Dict[str, float]
 
+@dataclass(frozen=True)
+class _EdgeInternal:
+    """Flattened, plain-attribute copy of an Edge used inside TrafficAssignment"""
+    # Declared by hand: dataclass(slots=True) needs Python 3.10
+    __slots__ = ("id", "source", "target", "function_type", "a", "k", "b",
+                 "free_flow_time", "capacity", "alpha", "beta")
+    
+    id: str
+    source: str
+    target: str
+    function_type: str
+    a: float
+    k: float
+    b: float
+    free_flow_time: float
+    capacity: float
+    alpha: float
+    beta: float
+    
+    @classmethod
+    def from_edge(cls, edge: Edge) -> "_EdgeInternal":
+        cf = edge.cost_function
+        if cf.function_type == "bpr" and cf.capacity <= 0:
+            # A BPR edge without capacity has the constant cost T: store it as 0*f + T
+            return cls(edge.id, edge.source, edge.target, "polynomial", 0.0, 1.0, cf.free_flow_time,
+                       cf.free_flow_time, cf.capacity, cf.alpha, cf.beta)
+        return cls(edge.id, edge.source, edge.target, cf.function_type, cf.a, cf.k, cf.b,
+                   cf.free_flow_time, cf.capacity, cf.alpha, cf.beta)
+
 # ─────────────────────────────────────────────────────────────────────────────
 # Cost Function Evaluation
 # ─────────────────────────────────────────────────────────────────────────────
+# All evaluators are Numba kernels over whole edge arrays, one per cost
+# function family so the loops carry no per-edge type branches:
+#   bpr_*:  t(f) = T*(1 + α*(f/C)^β)   parameters (T, C, alpha, beta)
+#   poly_*: t(f) = a*f^k + b            parameters (a, k, b)
+# TrafficAssignment stores BPR edges first and calls each family on its own
+# contiguous slice (see _build_cost_arrays). Results are written to `out`.
+# Exponents (beta, k) may be float or int64 arrays: Numba compiles a separate
+# specialization for int64, where x ** n is a multiply chain instead of libm pow,
+# so exponent arithmetic below is kept integer-preserving (k + 1, not k + 1.0).
+# Kernels are serial on purpose: endpoints run in FastAPI's threadpool, and
+# Numba's default workqueue threading layer is not safe to enter concurrently.
+
+@njit(fastmath=True, cache=True)
+def bpr_cost(flow, T, C, alpha, beta, out):
+    """Evaluate BPR edge costs at the given flows"""
+    for i in range(flow.shape[0]):
+        out[i] = T[i] * (1.0 + alpha[i] * (flow[i] / C[i]) ** beta[i])
+    return out
 
-def evaluate_cost(cost_func: EdgeCostFunction, flow: float) -> float:
-    """Evaluate the cost function at a given flow"""
-    if cost_func.function_type == "bpr":
-        ratio = flow / cost_func.capacity if cost_func.capacity > 0 else 0
-        return cost_func.free_flow_time * (1 + cost_func.alpha * (ratio ** cost_func.beta))
-    else:  # polynomial: a * f^k + b
-        return cost_func.a * (flow ** cost_func.k) + cost_func.b
-
-def evaluate_cost_derivative(cost_func: EdgeCostFunction, flow: float) -> float:
-    """Evaluate the derivative of cost function"""
-    if cost_func.function_type == "bpr":
-        if cost_func.capacity <= 0:
-            return 0
-        ratio = flow / cost_func.capacity
-        return cost_func.free_flow_time * cost_func.alpha * cost_func.beta * \
-               (ratio ** (cost_func.beta - 1)) / cost_func.capacity
-    else:  # polynomial: a * k * f^(k-1)
-        if cost_func.k == 0 or flow == 0:
-            return 0
-        return cost_func.a * cost_func.k * (flow ** (cost_func.k - 1))
-
-def evaluate_marginal_cost(cost_func: EdgeCostFunction, flow: float) -> float:
-    """Evaluate marginal cost: t(f) + f * t'(f)"""
-    return evaluate_cost(cost_func, flow) + flow * evaluate_cost_derivative(cost_func, flow)
-
-def evaluate_integral(cost_func: EdgeCostFunction, flow: float) -> float:
-    """Evaluate integral of cost function from 0 to flow (for Beckmann objective)"""
-    if cost_func.function_type == "bpr":
-        # ∫t(s)ds from 0 to f where t(s) = T*(1 + α*(s/C)^β)
-        T = cost_func.free_flow_time
-        C = cost_func.capacity
-        alpha = cost_func.alpha
-        beta = cost_func.beta
-        if C <= 0:
-            return T * flow
-        return T * flow + T * alpha * (flow ** (beta + 1)) / ((beta + 1) * (C ** beta))
-    else:  # polynomial: ∫(a*s^k + b)ds = a*f^(k+1)/(k+1) + b*f
-        a, k, b = cost_func.a, cost_func.k, cost_func.b
-        return a * (flow ** (k + 1)) / (k + 1) + b * flow
+@njit(fastmath=True, cache=True)
+def poly_cost(flow, a, k, b, out):
+    """Evaluate polynomial edge costs at the given flows"""
+    for i in range(flow.shape[0]):
+        out[i] = a[i] * flow[i] ** k[i] + b[i]
+    return out
+
+@njit(fastmath=True, cache=True)
+def bpr_cost_derivative(flow, T, C, alpha, beta, out):
+    """Evaluate the derivative of BPR edge costs"""
+    for i in range(flow.shape[0]):
+        out[i] = T[i] * alpha[i] * beta[i] * (flow[i] / C[i]) ** (beta[i] - 1) / C[i]
+    return out
+
+@njit(fastmath=True, cache=True)
+def poly_cost_derivative(flow, a, k, b, out):
+    """Evaluate the derivative of polynomial edge costs: a * k * f^(k-1)"""
+    for i in range(flow.shape[0]):
+        f = flow[i]
+        # A select rather than a branch; keeps f^(k-1) from blowing up at f = 0
+        out[i] = a[i] * k[i] * f ** (k[i] - 1) if f > 0.0 else 0.0
+    return out
+
+@njit(fastmath=True, cache=True)
+def bpr_marginal_cost(flow, T, C, alpha, beta, out):
+    """Evaluate BPR marginal cost: t(f) + f*t'(f) = T*(1 + α*(1 + β)*(f/C)^β)"""
+    for i in range(flow.shape[0]):
+        out[i] = T[i] * (1.0 + alpha[i] * (1.0 + beta[i]) * (flow[i] / C[i]) ** beta[i])
+    return out
+
+@njit(fastmath=True, cache=True)
+def poly_marginal_cost(flow, a, k, b, out):
+    """Evaluate polynomial marginal cost: t(f) + f*t'(f) = a*(1 + k)*f^k + b"""
+    for i in range(flow.shape[0]):
+        out[i] = a[i] * (1.0 + k[i]) * flow[i] ** k[i] + b[i]
+    return out
+
+@njit(fastmath=True, cache=True)
+def bpr_beckmann_value_and_grad(x, d, step, T, C, alpha, beta):
+    """
+    Beckmann objective of BPR edges at x + step*d and its derivative along d,
+    <t(x + step*d), d>, in a single pass over the edges
+    """
+    value = 0.0
+    slope = 0.0
+    for i in range(x.shape[0]):
+        f = x[i] + step * d[i]
+        scaled = alpha[i] * (f / C[i]) ** beta[i]
+        value += T[i] * f * (1.0 + scaled / (beta[i] + 1.0))
+        slope += T[i] * (1.0 + scaled) * d[i]
+    return value, slope
+
+@njit(fastmath=True, cache=True)
+def poly_beckmann_value_and_grad(x, d, step, a, k, b):
+    """Polynomial-edge counterpart of bpr_beckmann_value_and_grad"""
+    value = 0.0
+    slope = 0.0
+    for i in range(x.shape[0]):
+        f = x[i] + step * d[i]
+        power = f ** k[i]
+        value += a[i] * power * f / (k[i] + 1.0) + b[i] * f
+        slope += (a[i] * power + b[i]) * d[i]
+    return value, slope
+
+@njit(fastmath=True, cache=True)
+def bpr_system_cost_value_and_grad(x, d, step, T, C, alpha, beta):
+    """
+    Total system cost of BPR edges at x + step*d and its derivative along d,
+    <t(f) + f*t'(f), d>, in a single pass over the edges
+    """
+    value = 0.0
+    slope = 0.0
+    for i in range(x.shape[0]):
+        f = x[i] + step * d[i]
+        scaled = alpha[i] * (f / C[i]) ** beta[i]
+        value += f * T[i] * (1.0 + scaled)
+        slope += T[i] * (1.0 + scaled * (1.0 + beta[i])) * d[i]
+    return value, slope
+
+@njit(fastmath=True, cache=True)
+def poly_system_cost_value_and_grad(x, d, step, a, k, b):
+    """Polynomial-edge counterpart of bpr_system_cost_value_and_grad"""
+    value = 0.0
+    slope = 0.0
+    for i in range(x.shape[0]):
+        f = x[i] + step * d[i]
+        power = f ** k[i]
+        value += f * (a[i] * power + b[i])
+        slope += (a[i] * (1.0 + k[i]) * power + b[i]) * d[i]
+    return value, slope
+
+# (bpr kernel, polynomial kernel) pairs, as dispatched by TrafficAssignment
+COST_KERNELS = (bpr_cost, poly_cost)
+DERIVATIVE_KERNELS = (bpr_cost_derivative, poly_cost_derivative)
+MARGINAL_COST_KERNELS = (bpr_marginal_cost, poly_marginal_cost)
+BECKMANN_KERNELS = (bpr_beckmann_value_and_grad, poly_beckmann_value_and_grad)
+SYSTEM_COST_KERNELS = (bpr_system_cost_value_and_grad, poly_system_cost_value_and_grad)
+
+# Integer exponents up to this size use the multiply-chain specialization
+MAX_INT_EXPONENT = 64
+
+def warm_up_cost_kernels():
+    """Compile (or load from cache) the cost kernels with a 1-edge network"""
+    one = np.ones(1)
+    for exponent in (one, np.ones(1, dtype=np.int64)):
+        bpr_params = (one, one, one, exponent)
+        poly_params = (one, exponent, one)
+        for bpr_kernel, poly_kernel in (COST_KERNELS, DERIVATIVE_KERNELS, MARGINAL_COST_KERNELS):
+            bpr_kernel(one, *bpr_params, np.empty(1))
+            poly_kernel(one, *poly_params, np.empty(1))
+        for bpr_kernel, poly_kernel in (BECKMANN_KERNELS, SYSTEM_COST_KERNELS):
+            bpr_kernel(one, one, 0.5, *bpr_params)
+            poly_kernel(one, one, 0.5, *poly_params)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Path Finding
 # ─────────────────────────────────────────────────────────────────────────────
 
-def find_all_simple_paths(graph: nx.DiGraph, source: str, target: str, 
-                          max_paths: int = 50) -> List[List[str]]:
-    """Find all simple paths between source and target (limited for performance)"""
-    try:
-        paths = list(nx.all_simple_paths(graph, source, target, cutoff=10))
-        return paths[:max_paths]  # Limit number of paths for computational feasibility
-    except nx.NetworkXNoPath:
-        return []
-
-def path_to_edges(path: List[str], edge_map: Dict[Tuple[str, str], str]) -> List[str]:
-    """Convert a path of nodes to a list of edge IDs"""
-    edges = []
-    for i in range(len(path) - 1):
-        edge_key = (path[i], path[i+1])
-        if edge_key in edge_map:
-            edges.append(edge_map[edge_key])
-    return edges
+# (od, node path, edge IDs, flow)
+PathAssignment = Tuple[Tuple[str, str], List[str], List[str], float]
+
+# Path flows at or below this are not reported (nor reconstructed)
+MIN_PATH_FLOW = 1e-6
+# At most this many paths are peeled off the edge flows of one OD pair
+MAX_PATHS_PER_OD = 100
+
+def tree_path(predecessors: List[int], target: int) -> List[int]:
+    """
+    Node indices from the root of a shortest-path tree to target, following a
+    csgraph predecessor array (negative entries mark the root and unreached nodes)
+    """
+    path = [target]
+    while predecessors[path[-1]] >= 0:
+        path.append(predecessors[path[-1]])
+    path.reverse()
+    return path
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Frank-Wolfe Algorithm for Traffic Assignment
 # ─────────────────────────────────────────────────────────────────────────────
 
 class TrafficAssignment:
-    """Traffic assignment solver using Frank-Wolfe algorithm"""
+    """
+    Traffic assignment solver using link-based Frank-Wolfe algorithm.
+    Flows are stored per origin and per edge; paths are only recovered once
+    the solver has converged.
+    """
     
     def __init__(self, network: NetworkData):
         self.network = network
-        self.graph = nx.DiGraph()
-        self.edge_map: Dict[Tuple[str, str], str] = {}  # (source, target) -> edge_id
-        self.edge_data: Dict[str, Edge] = {}  # edge_id -> Edge
-        self.paths_by_od: Dict[Tuple[str, str], List[List[str]]] = {}
-        self.path_edge_matrix: Optional[np.ndarray] = None
-        self.all_paths: List[Tuple[Tuple[str, str], List[str], List[str]]] = []  # (od, path, edges)
-        
+        self.edge_data: Dict[str, _EdgeInternal] = {}  # edge_id -> edge
+        self.edge_ids: List[str] = []  # edge index -> edge_id (BPR edges first, see _build_cost_arrays)
+        self.edge_idx: Dict[str, int] = {}  # edge_id -> edge index
+        self.input_order: np.ndarray  # edge index of each network edge, in request order
+        self.node_ids: List[str] = []  # node index -> node_id
+        self.node_idx: Dict[str, int] = {}  # node_id -> row/column in the weight matrix
+        self.node_pair_edge: Dict[Tuple[int, int], int] = {}  # (source row, target column) -> edge index
+        self.origins: Dict[str, List[Tuple[str, float]]] = {}  # origin -> [(destination, demand)]
+        self.origin_demand_idx: List[Tuple[int, List[Tuple[int, float]]]] = []  # same, as node indices
+        self.origin_nodes: np.ndarray  # node index of each origin, in origin order
+        
+        warm_up_cost_kernels()
         self._build_graph()
-        self._find_paths()
+        self._build_cost_arrays()
+        self._group_demand()
+    
+    def _add_node(self, node_id: str) -> int:
+        if node_id not in self.node_idx:
+            self.node_idx[node_id] = len(self.node_ids)
+            self.node_ids.append(node_id)
+        return self.node_idx[node_id]
     
     def _build_graph(self):
-        """Build NetworkX graph from network data"""
+        """
+        Build the CSR adjacency matrix used for shortest paths. Its sparsity
+        pattern is fixed; solves only overwrite (a copy of) .data with edge costs.
+        """
         for node in self.network.nodes:
-            self.graph.add_node(node.id)
+            self._add_node(node.id)
         
-        for edge in self.network.edges:
-            self.graph.add_edge(edge.source, edge.target, id=edge.id)
-            self.edge_map[(edge.source, edge.target)] = edge.id
+        # Edge indices group edges evaluated by the same kernel into contiguous slices
+        edges = sorted(map(_EdgeInternal.from_edge, self.network.edges), key=self._cost_group)
+        for edge in edges:
+            self.edge_idx[edge.id] = len(self.edge_ids)
+            self.edge_ids.append(edge.id)
             self.edge_data[edge.id] = edge
+        # Parallel edges: the last one between a node pair in request order is the one routed on
+        for edge in self.network.edges:
+            self.node_pair_edge[(self._add_node(edge.source), self._add_node(edge.target))] = self.edge_idx[edge.id]
+        self.input_order = np.array([self.edge_idx[edge.id] for edge in self.network.edges], dtype=np.intp)
+        
+        rows = np.array([u for u, _ in self.node_pair_edge], dtype=np.intp)
+        cols = np.array([v for _, v in self.node_pair_edge], dtype=np.intp)
+        edge_indices = np.array(list(self.node_pair_edge.values()), dtype=np.intp)
+        n = len(self.node_ids)
+        # Store positions (1-based, so none is dropped as zero) to learn the CSR data order
+        self.weights = sparse.csr_matrix((np.arange(1, len(rows) + 1, dtype=np.float64), (rows, cols)), shape=(n, n))
+        self.weight_edge = edge_indices[self.weights.data.astype(np.intp) - 1]  # CSR data slot -> edge index
     
-    def _find_paths(self):
-        """Find all paths for each OD pair"""
-        for od in self.network.od_pairs:
-            paths = find_all_simple_paths(self.graph, od.origin, od.destination)
-            if not paths:
-                continue
-            
-            self.paths_by_od[(od.origin, od.destination)] = paths
-            
-            for path in paths:
-                edges = path_to_edges(path, self.edge_map)
-                self.all_paths.append(((od.origin, od.destination), path, edges))
+    @staticmethod
+    def _cost_group(edge: _EdgeInternal) -> Tuple[bool, bool]:
+        """Kernel group of an edge: (is polynomial, has a non-integer exponent)"""
+        is_bpr = edge.function_type == "bpr"
+        exponent = edge.beta if is_bpr else edge.k
+        return (not is_bpr, not (float(exponent).is_integer() and abs(exponent) <= MAX_INT_EXPONENT))
     
-    def _compute_edge_flows(self, path_flows: np.ndarray) -> Dict[str, float]:
-        """Compute edge flows from path flows"""
-        edge_flows = {edge.id: 0.0 for edge in self.network.edges}
-        
-        for i, (od, path, edges) in enumerate(self.all_paths):
-            for edge_id in edges:
-                edge_flows[edge_id] += path_flows[i]
-        
-        return edge_flows
+    def _build_cost_arrays(self):
+        """
+        Gather cost function parameters into per-group arrays. Edge indices are
+        ordered by _cost_group, so each group is a contiguous slice: BPR edges
+        before polynomial ones, integer exponents (passed as int64) first.
+        """
+        edges = [self.edge_data[edge_id] for edge_id in self.edge_ids]
+        self.cost_groups: List[Tuple[int, slice, Tuple[np.ndarray, ...]]] = []  # (family, edges, parameters)
+        start = 0
+        for (is_poly, fractional), group in groupby(edges, key=self._cost_group):
+            group = list(group)
+            names = ("a", "k", "b") if is_poly else ("free_flow_time", "capacity", "alpha", "beta")
+            params = tuple(np.array([getattr(edge, name) for edge in group], dtype=np.float64) for name in names)
+            if not fractional:
+                exponent = 1 if is_poly else 3
+                params = params[:exponent] + (params[exponent].astype(np.int64),) + params[exponent + 1:]
+            self.cost_groups.append((int(is_poly), slice(start, start + len(group)), params))
+            start += len(group)
     
-    def _compute_path_costs(self, edge_flows: Dict[str, float], use_marginal: bool = False) -> np.ndarray:
-        """Compute cost of each path based on edge flows"""
-        path_costs = np.zeros(len(self.all_paths))
-        
-        for i, (od, path, edges) in enumerate(self.all_paths):
-            cost = 0.0
-            for edge_id in edges:
-                edge = self.edge_data[edge_id]
-                flow = edge_flows[edge_id]
-                if use_marginal:
-                    cost += evaluate_marginal_cost(edge.cost_function, flow)
-                else:
-                    cost += evaluate_cost(edge.cost_function, flow)
-            path_costs[i] = cost
-        
-        return path_costs
+    def _evaluate(self, kernels, edge_flow: np.ndarray) -> np.ndarray:
+        """Run a (bpr, polynomial) kernel pair over each edge group's slice"""
+        out = np.empty_like(edge_flow)
+        for family, edges, params in self.cost_groups:
+            kernels[family](edge_flow[edges], *params, out[edges])
+        return out
     
-    def _all_or_nothing(self, path_costs: np.ndarray) -> np.ndarray:
-        """All-or-nothing assignment: assign all demand to shortest path for each OD"""
-        path_flows = np.zeros(len(self.all_paths))
-        
+    def _cost_vec(self, edge_flow: np.ndarray) -> np.ndarray:
+        """Edge costs t_e(f_e) for all edges"""
+        return self._evaluate(COST_KERNELS, edge_flow)
+    
+    def _deriv_vec(self, edge_flow: np.ndarray) -> np.ndarray:
+        """Cost derivatives t'_e(f_e) for all edges"""
+        return self._evaluate(DERIVATIVE_KERNELS, edge_flow)
+    
+    def _marginal_vec(self, edge_flow: np.ndarray) -> np.ndarray:
+        """Marginal costs t_e(f_e) + f_e * t'_e(f_e) for all edges"""
+        return self._evaluate(MARGINAL_COST_KERNELS, edge_flow)
+    
+    def _group_demand(self):
+        """Group OD pairs by origin so one shortest-path tree serves all destinations"""
         for od in self.network.od_pairs:
-            od_key = (od.origin, od.destination)
-            if od_key not in self.paths_by_od:
-                continue
-            
-            # Find path indices for this OD
-            od_path_indices = []
-            for i, (path_od, path, edges) in enumerate(self.all_paths):
-                if path_od == od_key:
-                    od_path_indices.append(i)
-            
-            if not od_path_indices:
-                continue
-            
-            # Find minimum cost path
-            od_costs = path_costs[od_path_indices]
-            min_idx = od_path_indices[np.argmin(od_costs)]
-            path_flows[min_idx] = od.demand
+            self.origins.setdefault(od.origin, []).append((od.destination, od.demand))
         
-        return path_flows
+        for origin, destinations in self.origins.items():
+            self.origin_demand_idx.append((
+                self.node_idx[origin],
+                [(self.node_idx[destination], demand) for destination, demand in destinations]
+            ))
+        self.origin_nodes = np.array([origin for origin, _ in self.origin_demand_idx], dtype=np.intp)
     
-    def _beckmann_objective(self, edge_flows: Dict[str, float]) -> float:
-        """Compute Beckmann objective: sum of integrals of cost functions"""
-        total = 0.0
-        for edge_id, flow in edge_flows.items():
-            edge = self.edge_data[edge_id]
-            total += evaluate_integral(edge.cost_function, flow)
-        return total
+    def _edge_costs(self, edge_flow: np.ndarray, use_marginal: bool = False) -> np.ndarray:
+        """Compute cost (or marginal cost) of each edge based on edge flows"""
+        return self._marginal_vec(edge_flow) if use_marginal else self._cost_vec(edge_flow)
     
-    def _system_cost_objective(self, edge_flows: Dict[str, float]) -> float:
-        """Compute total system cost: sum of f_e * t_e(f_e)"""
-        total = 0.0
-        for edge_id, flow in edge_flows.items():
-            edge = self.edge_data[edge_id]
-            total += flow * evaluate_cost(edge.cost_function, flow)
-        return total
+    def _all_or_nothing(self, edge_cost: np.ndarray, weights: sparse.csr_matrix,
+                        out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        All-or-nothing assignment: assign all demand to shortest path for each OD.
+        Runs Dijkstra from all origins in one call and returns edge flows per origin,
+        shape (origins, edges), written to `out` when given. `weights` is a copy of
+        self.weights whose data is overwritten with edge_cost.
+        """
+        origin_flow = np.zeros((len(self.origins), len(self.edge_ids))) if out is None else out
+        if not self.origin_demand_idx:
+            return origin_flow
+        weights.data[:] = edge_cost[self.weight_edge]
+        _, all_predecessors = dijkstra(weights, indices=self.origin_nodes, return_predecessors=True)
+        
+        for o, (origin, destinations) in enumerate(self.origin_demand_idx):
+            predecessors = all_predecessors[o].tolist()
+            edge_indices: List[int] = []
+            edge_demands: List[float] = []
+            for node, demand in destinations:
+                # Walk the shortest-path tree back from the destination (-9999 marks the root/unreached)
+                while predecessors[node] >= 0:
+                    edge_indices.append(self.node_pair_edge[(predecessors[node], node)])
+                    edge_demands.append(demand)
+                    node = predecessors[node]
+            origin_flow[o] = np.bincount(edge_indices, weights=edge_demands, minlength=len(self.edge_ids))
+        
+        return origin_flow
     
-    def _line_search(self, current_flows: np.ndarray, direction_flows: np.ndarray, 
-                     objective_type: str = "beckmann") -> float:
-        """Find optimal step size using line search"""
-        def objective(alpha):
-            new_flows = current_flows + alpha * (direction_flows - current_flows)
-            edge_flows = self._compute_edge_flows(new_flows)
-            if objective_type == "beckmann":
-                return self._beckmann_objective(edge_flows)
+    def _value_and_grad(self, step: float, x_edge: np.ndarray, d_edge: np.ndarray,
+                        use_marginal: bool = False) -> Tuple[float, float]:
+        """Objective at x + step*d and its derivative along d (Beckmann, or system cost if use_marginal)"""
+        kernels = SYSTEM_COST_KERNELS if use_marginal else BECKMANN_KERNELS
+        value = slope = 0.0
+        for family, edges, params in self.cost_groups:
+            group_value, group_slope = kernels[family](x_edge[edges], d_edge[edges], step, *params)
+            value += group_value
+            slope += group_slope
+        return value, slope
+    
+    def _line_search(self, current_flow: np.ndarray, direction_flow: np.ndarray, 
+                     use_marginal: bool = False, tolerance: float = 1e-8,
+                     initial_slope: Optional[float] = None, max_iter: int = 100) -> float:
+        """
+        Find optimal step size as the root of the directional derivative
+        g(α) = <t(x + α·d), d> of the (convex) objective along d = y - x.
+        Costs are marginal costs for the system cost objective.
+        
+        g is increasing, so [0, 1] brackets its single root; the bracket is
+        shrunk by false position with the Illinois correction, which needs a
+        handful of evaluations where bisection needs ~log2(1/tolerance).
+        initial_slope is g(0) when the caller already has it.
+        """
+        direction = direction_flow - current_flow
+        
+        def gradient(alpha):
+            return self._value_and_grad(alpha, current_flow, direction, use_marginal)[1]
+        
+        g_low = gradient(0.0) if initial_slope is None else initial_slope
+        if g_low >= 0:
+            return 0.0
+        g_high = gradient(1.0)
+        if g_high <= 0:
+            return 1.0
+        
+        low, high = 0.0, 1.0
+        alpha = 0.5
+        side = 0  # which end moved last: -1 low, 1 high
+        for _ in range(max_iter):
+            alpha = (low * g_high - high * g_low) / (g_high - g_low)
+            g = gradient(alpha)
+            if g < 0:
+                low, g_low = alpha, g
+                if side == -1:
+                    g_high *= 0.5  # the high end is stuck: halve its weight
+                side = -1
+            elif g > 0:
+                high, g_high = alpha, g
+                if side == 1:
+                    g_low *= 0.5
+                side = 1
             else:
-                return self._system_cost_objective(edge_flows)
-        
-        result = minimize_scalar(objective, bounds=(0, 1), method='bounded')
-        return result.x
+                break
+            if high - low <= tolerance:
+                break
+        return alpha
     
-    def solve_wardrop_equilibrium(self, max_iter: int = 1000, tolerance: float = 1e-6) -> Tuple[np.ndarray, Dict[str, float]]:
+    def _frank_wolfe(self, use_marginal: bool, max_iter: int, tolerance: float,
+                     initial_origin_flow: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
         """
-        Solve for Wardrop (User) Equilibrium using Frank-Wolfe algorithm.
-        Minimizes Beckmann objective: sum of integrals of cost functions
+        Run Frank-Wolfe on edge flows, returning (origin edge flows, edge flows,
+        edge costs at those flows; marginal costs if use_marginal).
+        Starts from initial_origin_flow (a feasible assignment) when given.
+        Stops once the relative gap <c(x), x - y> / |objective(x)| drops below tolerance.
         """
-        if not self.all_paths:
-            return np.array([]), {}
+        # Solver instances may be shared between requests, so keep per-solve weights
+        weights = self.weights.copy()
         
-        # Initialize with all-or-nothing assignment
-        edge_flows = {edge.id: 0.0 for edge in self.network.edges}
-        path_costs = self._compute_path_costs(edge_flows)
-        path_flows = self._all_or_nothing(path_costs)
+        if initial_origin_flow is not None:
+            origin_flow = initial_origin_flow.copy()
+        else:
+            # Initialize with all-or-nothing assignment on free-flow costs
+            origin_flow = self._all_or_nothing(self._edge_costs(np.zeros(len(self.edge_ids)), use_marginal), weights)
+        edge_flow = origin_flow.sum(axis=0)
+        direction = np.empty_like(origin_flow)  # reused every iteration
         
         for iteration in range(max_iter):
-            # Compute current edge flows
-            edge_flows = self._compute_edge_flows(path_flows)
-            
-            # Compute path costs based on current flows
-            path_costs = self._compute_path_costs(edge_flows, use_marginal=False)
+            # All-or-nothing assignment on current costs for search direction
+            edge_cost = self._edge_costs(edge_flow, use_marginal)
+            self._all_or_nothing(edge_cost, weights, out=direction)
+            direction_flow = direction.sum(axis=0)
             
-            # All-or-nothing assignment for search direction
-            direction_flows = self._all_or_nothing(path_costs)
+            # Check convergence (relative Frank-Wolfe gap)
+            gap = np.dot(edge_cost, edge_flow - direction_flow)
+            objective, slope = self._value_and_grad(0.0, edge_flow, direction_flow - edge_flow, use_marginal)
+            if gap / max(1e-12, abs(objective)) < tolerance:
+                break
             
             # Line search
-            alpha = self._line_search(path_flows, direction_flows, "beckmann")
-            
-            # Update flows
-            new_path_flows = path_flows + alpha * (direction_flows - path_flows)
+            alpha = self._line_search(edge_flow, direction_flow, use_marginal, initial_slope=slope)
             
-            # Check convergence
-            if np.max(np.abs(new_path_flows - path_flows)) < tolerance:
-                path_flows = new_path_flows
-                break
+            # Update flows in place: x <- (1 - α)·x + α·y (direction is refilled next iteration)
+            origin_flow *= 1.0 - alpha
+            direction *= alpha
+            origin_flow += direction
+            edge_flow *= 1.0 - alpha
+            edge_flow += alpha * direction_flow
+        else:
+            # Out of iterations: the last costs predate the final update
+            edge_cost = self._edge_costs(edge_flow, use_marginal)
+        
+        return origin_flow, edge_flow, edge_cost
+    
+    def _decompose_paths(self, origin_flow: np.ndarray, edge_cost: np.ndarray) -> List[PathAssignment]:
+        """
+        Recover path flows for every OD pair by peeling the cheapest
+        flow-carrying path off its origin's edge flows until demand is met.
+        Only paths carrying more than MIN_PATH_FLOW are reconstructed, at most
+        MAX_PATHS_PER_OD of them; demand left over from the cutoffs is added to
+        the OD's largest path so path flows still sum to its demand.
+        """
+        paths: List[PathAssignment] = []
+        weights = self.weights.copy()
+        slot_cost = edge_cost[self.weight_edge]
+        
+        def shortest_path(origin: int, destination: int, residual: Optional[np.ndarray] = None) -> List[int]:
+            # Edges without residual flow are hidden behind an infinite weight
+            weights.data[:] = (slot_cost if residual is None
+                               else np.where(residual[self.weight_edge] > MIN_PATH_FLOW, slot_cost, np.inf))
+            _, predecessors = dijkstra(weights, indices=origin, return_predecessors=True)
+            path = tree_path(predecessors.tolist(), destination)
+            return [self.node_pair_edge[(u, v)] for u, v in zip(path[:-1], path[1:])] if len(path) > 1 else []
+        
+        def assignment(od: Tuple[str, str], edge_path: List[int], flow: float) -> PathAssignment:
+            nodes = [od[0]] + [self.edge_data[self.edge_ids[e]].target for e in edge_path]
+            return (od, nodes, [self.edge_ids[e] for e in edge_path], flow)
+        
+        for o, (origin, destinations) in enumerate(self.origin_demand_idx):
+            residual = origin_flow[o].copy()
             
-            path_flows = new_path_flows
-        
-        return path_flows, self._compute_edge_flows(path_flows)
+            for destination, demand in destinations:
+                od = (self.node_ids[origin], self.node_ids[destination])
+                if origin == destination:
+                    paths.append((od, [od[0]], [], demand))
+                    continue
+                
+                od_paths: List[PathAssignment] = []
+                remaining = demand
+                while remaining > MIN_PATH_FLOW and len(od_paths) < MAX_PATHS_PER_OD:
+                    edge_path = shortest_path(origin, destination, residual)
+                    if not edge_path:
+                        break
+                    flow = min(remaining, residual[edge_path].min())
+                    residual[edge_path] -= flow
+                    remaining -= flow
+                    od_paths.append(assignment(od, edge_path, flow))
+                
+                if od_paths and remaining > 0:
+                    largest = max(range(len(od_paths)), key=lambda i: od_paths[i][3])
+                    od, nodes, edges, flow = od_paths[largest]
+                    od_paths[largest] = (od, nodes, edges, flow + remaining)
+                
+                if not od_paths:
+                    # No demand to peel off: still report the cheapest route for OD costs
+                    edge_path = shortest_path(origin, destination)
+                    if not edge_path:
+                        continue
+                    od_paths.append(assignment(od, edge_path, 0.0))
+                
+                paths.extend(od_paths)
+        
+        return paths
+    
+    def _od_path_indices(self, paths: List[PathAssignment]) -> Dict[Tuple[str, str], np.ndarray]:
+        """Group path positions by OD pair"""
+        od_path_idx: Dict[Tuple[str, str], List[int]] = {}
+        for i, (od, path, edges, flow) in enumerate(paths):
+            od_path_idx.setdefault(od, []).append(i)
+        return {od: np.array(indices, dtype=np.intp) for od, indices in od_path_idx.items()}
+    
+    def _path_incidence(self, paths: List[PathAssignment]) -> sparse.csr_matrix:
+        """Build the sparse edge-path incidence matrix M (M[e, p] = 1 if edge e is on path p)"""
+        rows: List[int] = []
+        cols: List[int] = []
+        for p, (od, path, edges, flow) in enumerate(paths):
+            rows.extend(self.edge_idx[edge_id] for edge_id in edges)
+            cols.extend([p] * len(edges))
+        return sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                 shape=(len(self.edge_ids), len(paths)))
     
-    def solve_system_optimum(self, max_iter: int = 1000, tolerance: float = 1e-6) -> Tuple[np.ndarray, Dict[str, float]]:
+    def solve_wardrop_equilibrium(self, max_iter: int = 1000,
+                                  tolerance: float = 1e-6
+                                  ) -> Tuple[List[PathAssignment], np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Solve for Wardrop (User) Equilibrium using Frank-Wolfe algorithm.
+        Minimizes Beckmann objective: sum of integrals of cost functions.
+        Stops when the relative Frank-Wolfe gap falls below tolerance.
+        Returns (paths, edge flows, edge costs) ready for format_results, plus
+        the per-origin edge flows for warm-starting solve_system_optimum.
+        """
+        origin_flow, edge_flow, edge_cost = self._frank_wolfe(False, max_iter, tolerance)
+        paths = self._decompose_paths(origin_flow, edge_cost)
+        return paths, edge_flow, edge_cost, origin_flow
+    
+    def solve_system_optimum(self, max_iter: int = 1000, tolerance: float = 1e-6,
+                             initial_origin_flow: Optional[np.ndarray] = None
+                             ) -> Tuple[List[PathAssignment], np.ndarray, np.ndarray]:
         """
         Solve for System Optimum using Frank-Wolfe algorithm.
         Minimizes total system cost: sum of f_e * t_e(f_e)
         Uses marginal costs in path finding.
+        Warm-starts from initial_origin_flow (e.g. the Wardrop equilibrium's
+        per-origin edge flows) when given, instead of all-or-nothing on
+        free-flow marginal costs.
+        Stops when the relative Frank-Wolfe gap falls below tolerance.
+        Returns (paths, edge flows, edge costs), ready for format_results.
         """
-        if not self.all_paths:
-            return np.array([]), {}
-        
-        # Initialize with all-or-nothing assignment using marginal costs
-        edge_flows = {edge.id: 0.0 for edge in self.network.edges}
-        path_costs = self._compute_path_costs(edge_flows, use_marginal=True)
-        path_flows = self._all_or_nothing(path_costs)
-        
-        for iteration in range(max_iter):
-            # Compute current edge flows
-            edge_flows = self._compute_edge_flows(path_flows)
-            
-            # Compute path costs using marginal costs
-            path_costs = self._compute_path_costs(edge_flows, use_marginal=True)
-            
-            # All-or-nothing assignment for search direction
-            direction_flows = self._all_or_nothing(path_costs)
-            
-            # Line search for system cost objective
-            alpha = self._line_search(path_flows, direction_flows, "system")
-            
-            # Update flows
-            new_path_flows = path_flows + alpha * (direction_flows - path_flows)
-            
-            # Check convergence
-            if np.max(np.abs(new_path_flows - path_flows)) < tolerance:
-                path_flows = new_path_flows
-                break
-            
-            path_flows = new_path_flows
-        
-        return path_flows, self._compute_edge_flows(path_flows)
+        origin_flow, edge_flow, marginal_cost = self._frank_wolfe(True, max_iter, tolerance, initial_origin_flow)
+        paths = self._decompose_paths(origin_flow, marginal_cost)
+        return paths, edge_flow, self._cost_vec(edge_flow)
     
-    def compute_optimal_tolls(self, so_edge_flows: Dict[str, float]) -> Dict[str, float]:
+    def compute_optimal_tolls(self, so_edge_flow: np.ndarray) -> np.ndarray:
         """Compute optimal tolls using marginal cost pricing: τ_e = f_e * t'_e(f_e)"""
-        tolls = {}
-        for edge_id, flow in so_edge_flows.items():
-            edge = self.edge_data[edge_id]
-            tolls[edge_id] = flow * evaluate_cost_derivative(edge.cost_function, flow)
-        return tolls
+        return so_edge_flow * self._deriv_vec(so_edge_flow)
     
-    def format_results(self, path_flows: np.ndarray, edge_flows: Dict[str, float], 
-                       tolls: Optional[Dict[str, float]] = None) -> EquilibriumResult:
-        """Format results into response model"""
+    def format_results(self, paths: List[PathAssignment], edge_flow: np.ndarray, edge_cost: np.ndarray,
+                       tolls: Optional[np.ndarray] = None) -> EquilibriumResult:
+        """Format results into response model; edge_cost are the costs t_e(f_e) at edge_flow"""
         # Determine max flow for congestion level normalization
-        max_flow = max(edge_flows.values()) if edge_flows and max(edge_flows.values()) > 0 else 1.0
-        
-        edge_results = []
-        for edge_id, flow in edge_flows.items():
-            edge = self.edge_data[edge_id]
-            cost = evaluate_cost(edge.cost_function, flow)
-            toll = tolls.get(edge_id, 0.0) if tolls else 0.0
-            congestion = min(flow / max_flow, 1.0) if max_flow > 0 else 0.0
-            
-            edge_results.append(EdgeResult(
-                id=edge_id,
-                flow=round(flow, 4),
-                cost=round(cost, 4),
-                toll=round(toll, 4),
-                congestion_level=round(congestion, 4)
-            ))
-        
-        # Format path flows
-        path_flow_results = []
-        for i, (od, path, edges) in enumerate(self.all_paths):
-            if path_flows[i] > 1e-6:  # Only include paths with non-zero flow
-                path_flow_results.append(PathFlow(
-                    path=path,
-                    edges=edges,
-                    flow=round(path_flows[i], 4)
-                ))
+        max_flow = edge_flow.max() if edge_flow.size and edge_flow.max() > 0 else 1.0
+        
+        edge_toll = tolls if tolls is not None else np.zeros_like(edge_flow)
+        congestion = np.clip(edge_flow / max_flow, 0.0, 1.0)
+        
+        # Round in bulk; values are already plain floats, so skip model validation.
+        # Edges are reported in request order.
+        order = self.input_order
+        edge_results = [
+            EdgeResult.model_construct(id=edge.id, flow=flow, cost=cost, toll=toll, congestion_level=level)
+            for edge, flow, cost, toll, level in zip(
+                self.network.edges,
+                np.round(edge_flow[order], 4).tolist(),
+                np.round(edge_cost[order], 4).tolist(),
+                np.round(edge_toll[order], 4).tolist(),
+                np.round(congestion[order], 4).tolist()
+            )
+        ]
+        
+        # Format path flows (only paths with non-zero flow)
+        path_flows = np.array([flow for _, _, _, flow in paths])
+        path_flow_results = [
+            PathFlow.model_construct(path=path, edges=edges, flow=flow)
+            for (od, path, edges, _), flow, used in zip(paths, np.round(path_flows, 4).tolist(), path_flows > MIN_PATH_FLOW)
+            if used
+        ]
         
         # Compute total system cost
-        total_cost = sum(
-            edge_flows[edge_id] * evaluate_cost(self.edge_data[edge_id].cost_function, edge_flows[edge_id])
-            for edge_id in edge_flows
-        )
+        total_cost = float(np.dot(edge_flow, edge_cost))
+        
+        # Compute OD costs (flow-weighted path cost for each OD)
+        path_costs = self._path_incidence(paths).T @ edge_cost
+        
+        od_keys = []
+        od_avg_costs = []
+        for (origin, destination), idx in self._od_path_indices(paths).items():
+            # Weighted average cost
+            total_flow = path_flows[idx].sum()
+            if total_flow > 0:
+                avg_cost = np.dot(path_flows[idx], path_costs[idx]) / total_flow
+            else:
+                avg_cost = path_costs[idx[np.argmin(path_costs[idx])]]
+            od_keys.append(f"{origin}->{destination}")
+            od_avg_costs.append(avg_cost)
+        od_costs = dict(zip(od_keys, np.round(np.array(od_avg_costs, dtype=np.float64), 4).tolist()))
         
-        # Compute OD costs (minimum path cost for each OD)
-        od_costs = {}
-        path_costs = self._compute_path_costs(edge_flows)
-        for od in self.network.od_pairs:
-            od_key = (od.origin, od.destination)
-            od_path_indices = [i for i, (p_od, _, _) in enumerate(self.all_paths) if p_od == od_key]
-            if od_path_indices:
-                # Weighted average cost
-                total_flow = sum(path_flows[i] for i in od_path_indices)
-                if total_flow > 0:
-                    avg_cost = sum(path_flows[i] * path_costs[i] for i in od_path_indices) / total_flow
-                else:
-                    avg_cost = min(path_costs[i] for i in od_path_indices)
-                od_costs[f"{od.origin}->{od.destination}"] = round(avg_cost, 4)
-        
-        return EquilibriumResult(
+        return EquilibriumResult.model_construct(
             edge_results=edge_results,
             path_flows=path_flow_results,
             total_system_cost=round(total_cost, 4),
             od_costs=od_costs
         )
 
+# ─────────────────────────────────────────────────────────────────────────────
+# Solver Cache
+# ─────────────────────────────────────────────────────────────────────────────
+# Building a solver (graph, weight matrix, cost arrays) only depends on the
+# network, so repeated /compute calls for the same network reuse it.
+
+SOLVER_CACHE_SIZE = 16
+_solver_cache: "OrderedDict[str, TrafficAssignment]" = OrderedDict()
+_solver_cache_lock = threading.Lock()
+
+def network_key(network: NetworkData) -> str:
+    """Stable hash of everything in the network that affects the solution (node positions do not)"""
+    data = network.model_dump(exclude={"nodes": {"__all__": {"x", "y"}}})
+    return hashlib.blake2b(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+def get_solver(network: NetworkData) -> TrafficAssignment:
+    """Return the cached solver for this network, building it on a miss (LRU eviction)"""
+    key = network_key(network)
+    with _solver_cache_lock:
+        solver = _solver_cache.get(key)
+        if solver is not None:
+            _solver_cache.move_to_end(key)
+            return solver
+    
+    solver = TrafficAssignment(network)
+    with _solver_cache_lock:
+        _solver_cache[key] = solver
+        if len(_solver_cache) > SOLVER_CACHE_SIZE:
+            _solver_cache.popitem(last=False)
+    return solver
+
 # ─────────────────────────────────────────────────────────────────────────────
 # API Endpoints
 # ─────────────────────────────────────────────────────────────────────────────
@@ -430,6 +746,9 @@ def compute_equilibrium(network: NetworkData):
     """
     Compute both Wardrop Equilibrium and System Optimum for the given network.
     Returns flow distributions, costs, and optimal tolls.
+    The result is serialized straight to JSON bytes by pydantic-core rather
+    than going through FastAPI's response encoding (response_model still
+    documents the schema).
     """
     try:
         # Validate input
@@ -448,27 +767,31 @@ def compute_equilibrium(network: NetworkData):
             if od.destination not in node_ids:
                 raise HTTPException(status_code=400, detail=f"Destination node {od.destination} not found")
         
-        # Create solver
-        solver = TrafficAssignment(network)
+        # Create (or reuse) solver
+        solver = get_solver(network)
         
         # Solve for Wardrop Equilibrium
-        we_path_flows, we_edge_flows = solver.solve_wardrop_equilibrium()
-        we_result = solver.format_results(we_path_flows, we_edge_flows)
+        we_paths, we_edge_flow, we_edge_cost, we_origin_flow = solver.solve_wardrop_equilibrium()
+        we_result = solver.format_results(we_paths, we_edge_flow, we_edge_cost)
         
-        # Solve for System Optimum
-        so_path_flows, so_edge_flows = solver.solve_system_optimum()
-        optimal_tolls = solver.compute_optimal_tolls(so_edge_flows)
-        so_result = solver.format_results(so_path_flows, so_edge_flows, optimal_tolls)
+        # Solve for System Optimum, starting from the equilibrium flows
+        so_paths, so_edge_flow, so_edge_cost = solver.solve_system_optimum(initial_origin_flow=we_origin_flow)
+        optimal_tolls = solver.compute_optimal_tolls(so_edge_flow)
+        so_result = solver.format_results(so_paths, so_edge_flow, so_edge_cost, optimal_tolls)
         
         # Calculate Price of Anarchy
         poa = we_result.total_system_cost / so_result.total_system_cost if so_result.total_system_cost > 0 else 1.0
         
-        return ComputationResult(
+        result = ComputationResult.model_construct(
             wardrop_equilibrium=we_result,
             system_optimum=so_result,
             price_of_anarchy=round(poa, 4),
-            optimal_tolls={k: round(v, 4) for k, v in optimal_tolls.items()}
+            optimal_tolls=dict(zip(
+                (edge.id for edge in network.edges),
+                np.round(optimal_tolls[solver.input_order], 4).tolist()
+            ))
         )
+        return Response(content=result.model_dump_json(), media_type="application/json")
         
     except HTTPException:
         raise
@@ -479,22 +802,32 @@ def compute_equilibrium(network: NetworkData):
 def validate_network(network: NetworkData):
     """Validate network structure and check for connectivity"""
     try:
-        graph = nx.DiGraph()
-        for node in network.nodes:
-            graph.add_node(node.id)
-        for edge in network.edges:
-            graph.add_edge(edge.source, edge.target)
+        node_idx: Dict[str, int] = {}
+        for node_id in [node.id for node in network.nodes] + [n for edge in network.edges for n in (edge.source, edge.target)]:
+            node_idx.setdefault(node_id, len(node_idx))
+        sources = np.array([node_idx[edge.source] for edge in network.edges], dtype=np.intp)
+        targets = np.array([node_idx[edge.target] for edge in network.edges], dtype=np.intp)
+        graph = sparse.csr_matrix((np.ones(len(sources)), (sources, targets)), shape=(len(node_idx), len(node_idx)))
         
         issues = []
         
-        # Check for connectivity between OD pairs
+        # Check for connectivity between OD pairs: one traversal per distinct origin
+        for od in network.od_pairs:
+            for role, node_id in (("Source", od.origin), ("Target", od.destination)):
+                if node_id not in node_idx:
+                    raise ValueError(f"{role} {node_id} is not in G")
+        origins = list(dict.fromkeys(od.origin for od in network.od_pairs))
+        origin_row = {origin: row for row, origin in enumerate(origins)}
+        if origins:
+            distances = dijkstra(graph, indices=[node_idx[origin] for origin in origins], unweighted=True)
         for od in network.od_pairs:
-            if not nx.has_path(graph, od.origin, od.destination):
+            if np.isinf(distances[origin_row[od.origin], node_idx[od.destination]]):
                 issues.append(f"No path from {od.origin} to {od.destination}")
         
         # Check for isolated nodes
+        degree = np.bincount(np.concatenate([sources, targets]), minlength=len(node_idx))
         for node in network.nodes:
-            if graph.degree(node.id) == 0:
+            if degree[node_idx[node.id]] == 0:
                 issues.append(f"Node {node.id} is isolated")
         
         return {